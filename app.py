@@ -1,15 +1,23 @@
-from flask import Flask, request, jsonify, render_template_string
+from flask import Flask, request, jsonify, render_template_string, Response, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
+from sqlalchemy.dialects import postgresql, sqlite
+from concurrent.futures import TimeoutError as FutureTimeoutError
 from datetime import datetime
+import io
+import math
 import os
 import uuid
 
+import numpy as np
+
+import heart_predictor
+
 app = Flask(__name__)
 CORS(app)
 
 # Database configuration
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///civictrack.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///civictrack.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'uploads'
 
@@ -55,6 +63,92 @@ class User(db.Model):
     votes_cast = db.Column(db.Integer, default=0)
     joined_at = db.Column(db.DateTime, default=datetime.utcnow)
 
+# Map clustering: issue counts are pre-aggregated into Web Mercator tile cells
+# for every zoom level, so a viewport query only reads the visible cells.
+MAX_CLUSTER_ZOOM = 16
+MAX_VIEWPORT_CELLS = 1024
+
+class ClusterCell(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    zoom = db.Column(db.Integer, nullable=False)
+    cell_x = db.Column(db.Integer, nullable=False)
+    cell_y = db.Column(db.Integer, nullable=False)
+    category = db.Column(db.String(50), nullable=False)
+    status = db.Column(db.String(20), nullable=False)
+    count = db.Column(db.Integer, default=0, nullable=False)
+    latitude_sum = db.Column(db.Float, default=0.0, nullable=False)
+    longitude_sum = db.Column(db.Float, default=0.0, nullable=False)
+
+    __table_args__ = (
+        db.UniqueConstraint('zoom', 'cell_x', 'cell_y', 'category', 'status'),
+    )
+
+def lat_lng_to_cell(latitude, longitude, zoom):
+    n = 2 ** zoom
+    latitude = max(min(latitude, 85.05112878), -85.05112878)
+    x = int((longitude + 180.0) / 360.0 * n)
+    y = int((1.0 - math.asinh(math.tan(math.radians(latitude))) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+def adjust_cluster_cells(issue, status, delta):
+    """Add (or remove, with a negative delta) an issue from its cell at every zoom.
+
+    Counts are incremented in SQL, so concurrent writers never overwrite each
+    other. Cells that drop to zero are kept and filtered out when queried.
+    """
+    if issue.latitude is None or issue.longitude is None:
+        return
+    cells = [
+        (zoom,) + lat_lng_to_cell(issue.latitude, issue.longitude, zoom)
+        for zoom in range(MAX_CLUSTER_ZOOM + 1)
+    ]
+    if delta > 0:
+        dialect = postgresql if db.engine.dialect.name == 'postgresql' else sqlite
+        db.session.execute(
+            dialect.insert(ClusterCell.__table__).values([
+                {
+                    'zoom': zoom, 'cell_x': cell_x, 'cell_y': cell_y,
+                    'category': issue.category, 'status': status,
+                    'count': 0, 'latitude_sum': 0.0, 'longitude_sum': 0.0
+                }
+                for zoom, cell_x, cell_y in cells
+            ]).on_conflict_do_nothing()
+        )
+    ClusterCell.query.filter(
+        ClusterCell.category == issue.category,
+        ClusterCell.status == status,
+        db.or_(*[
+            db.and_(ClusterCell.zoom == zoom, ClusterCell.cell_x == cell_x, ClusterCell.cell_y == cell_y)
+            for zoom, cell_x, cell_y in cells
+        ])
+    ).update({
+        ClusterCell.count: ClusterCell.count + delta,
+        ClusterCell.latitude_sum: ClusterCell.latitude_sum + delta * issue.latitude,
+        ClusterCell.longitude_sum: ClusterCell.longitude_sum + delta * issue.longitude
+    }, synchronize_session=False)
+
+def rebuild_cluster_cells():
+    """Recompute every cluster cell from the issue table (used to backfill)."""
+    ClusterCell.query.delete()
+    cells = {}
+    issues = Issue.query.filter(Issue.latitude.isnot(None), Issue.longitude.isnot(None)).all()
+    for issue in issues:
+        for zoom in range(MAX_CLUSTER_ZOOM + 1):
+            cell_x, cell_y = lat_lng_to_cell(issue.latitude, issue.longitude, zoom)
+            key = (zoom, cell_x, cell_y, issue.category, issue.status or 'reported')
+            cell = cells.get(key)
+            if cell is None:
+                cell = cells[key] = ClusterCell(
+                    zoom=zoom, cell_x=cell_x, cell_y=cell_y,
+                    category=key[3], status=key[4],
+                    count=0, latitude_sum=0.0, longitude_sum=0.0
+                )
+            cell.count += 1
+            cell.latitude_sum += issue.latitude
+            cell.longitude_sum += issue.longitude
+    db.session.add_all(cells.values())
+    db.session.commit()
+
 # HTML Template (Complete Frontend)
 HTML_TEMPLATE = '''
 <!DOCTYPE html>
@@ -570,6 +664,20 @@ def create_issue():
         category = data['category'].strip()
         location = data['location'].strip()[:200]
         
+        # Optional coordinates
+        latitude = data.get('latitude')
+        longitude = data.get('longitude')
+        if (latitude is None) != (longitude is None):
+            return jsonify({'error': 'Invalid coordinates'}), 400
+        if latitude is not None:
+            try:
+                latitude = float(latitude)
+                longitude = float(longitude)
+            except (TypeError, ValueError):
+                return jsonify({'error': 'Invalid coordinates'}), 400
+            if not (-90 <= latitude <= 90 and -180 <= longitude <= 180):
+                return jsonify({'error': 'Invalid coordinates'}), 400
+        
         # Validate category
         valid_categories = ['roads', 'lighting', 'water', 'cleanliness', 'safety', 'obstructions']
         if category not in valid_categories:
@@ -580,10 +688,14 @@ def create_issue():
             description=description,
             category=category,
             location=location,
+            status='reported',
+            latitude=latitude,
+            longitude=longitude,
             reporter_id=data.get('reporter_id', 'anonymous')
         )
         
         db.session.add(issue)
+        adjust_cluster_cells(issue, issue.status, 1)
         db.session.commit()
         
         return jsonify({
@@ -636,8 +748,22 @@ def update_status(issue_id):
         if new_status not in valid_statuses:
             return jsonify({'error': 'Invalid status'}), 400
         
+        updated_at = datetime.utcnow()
+        if issue.status != new_status:
+            # Only the request that actually moves the issue out of its old
+            # status may move it between cluster cells
+            changed = Issue.query.filter_by(id=issue.id, status=issue.status).update(
+                {Issue.status: new_status, Issue.updated_at: updated_at},
+                synchronize_session=False
+            )
+            if not changed:
+                db.session.rollback()
+                return jsonify({'error': 'Status was changed concurrently, please retry'}), 409
+            adjust_cluster_cells(issue, issue.status, -1)
+            adjust_cluster_cells(issue, new_status, 1)
+        
         issue.status = new_status
-        issue.updated_at = datetime.utcnow()
+        issue.updated_at = updated_at
         db.session.commit()
         
         return jsonify({
@@ -649,10 +775,136 @@ def update_status(issue_id):
         db.session.rollback()
         return jsonify({'error': 'Failed to update status'}), 500
 
+@app.route('/api/map/clusters', methods=['GET'])
+def get_clusters():
+    try:
+        zoom = min(max(int(request.args.get('zoom', 0)), 0), MAX_CLUSTER_ZOOM)
+        min_lat = float(request.args['min_lat'])
+        min_lng = float(request.args['min_lng'])
+        max_lat = float(request.args['max_lat'])
+        max_lng = float(request.args['max_lng'])
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'error': 'Invalid viewport'}), 400
+    
+    if not all(math.isfinite(value) for value in (min_lat, min_lng, max_lat, max_lng)) or min_lat > max_lat:
+        return jsonify({'error': 'Invalid viewport'}), 400
+    
+    # Tile y grows southwards, so the top edge of the viewport is max_lat
+    min_x, min_y = lat_lng_to_cell(max_lat, min_lng, zoom)
+    max_x, max_y = lat_lng_to_cell(min_lat, max_lng, zoom)
+    
+    columns = max_x - min_x + 1 if min_lng <= max_lng else 2 ** zoom - min_x + max_x + 1
+    if columns * (max_y - min_y + 1) > MAX_VIEWPORT_CELLS:
+        return jsonify({'error': 'Viewport too large for this zoom level'}), 400
+    
+    query = ClusterCell.query.filter(
+        ClusterCell.zoom == zoom,
+        ClusterCell.count > 0,
+        ClusterCell.cell_y.between(min_y, max_y)
+    )
+    if min_lng <= max_lng:
+        query = query.filter(ClusterCell.cell_x.between(min_x, max_x))
+    else:
+        # Viewport crosses the antimeridian
+        query = query.filter(db.or_(ClusterCell.cell_x >= min_x, ClusterCell.cell_x <= max_x))
+    
+    clusters = {}
+    for cell in query.all():
+        cluster = clusters.setdefault((cell.cell_x, cell.cell_y), {
+            'cell_x': cell.cell_x,
+            'cell_y': cell.cell_y,
+            'count': 0,
+            'latitude_sum': 0.0,
+            'longitude_sum': 0.0,
+            'categories': {},
+            'statuses': {}
+        })
+        cluster['count'] += cell.count
+        cluster['latitude_sum'] += cell.latitude_sum
+        cluster['longitude_sum'] += cell.longitude_sum
+        cluster['categories'][cell.category] = cluster['categories'].get(cell.category, 0) + cell.count
+        cluster['statuses'][cell.status] = cluster['statuses'].get(cell.status, 0) + cell.count
+    
+    result = []
+    for cluster in clusters.values():
+        # Centroid of the issues in the cell, so markers sit where reports are
+        cluster['latitude'] = cluster.pop('latitude_sum') / cluster['count']
+        cluster['longitude'] = cluster.pop('longitude_sum') / cluster['count']
+        result.append(cluster)
+    
+    return jsonify({
+        'zoom': zoom,
+        'clusters': result
+    })
+
+@app.route('/api/predict', methods=['POST'])
+def predict_heart_disease():
+    data = request.get_json(silent=True)
+    records = data if isinstance(data, list) else [data]
+    if not records or not all(isinstance(record, dict) for record in records):
+        return jsonify({'error': 'Expected a record or a list of records'}), 400
+    if len(records) > heart_predictor.MAX_REQUEST_RECORDS:
+        return jsonify({'error': 'Too many records, use /api/predict/batch'}), 413
+    
+    try:
+        batcher = heart_predictor.get_batcher()
+    except heart_predictor.ModelUnavailable as e:
+        return jsonify({'error': str(e)}), 503
+    
+    try:
+        matrix = batcher.predictor.transform(records)
+    except (TypeError, ValueError):
+        return jsonify({'error': 'Invalid feature value'}), 400
+    
+    try:
+        # Queue in batch-sized pieces so a large request cannot hog the batcher
+        futures = [
+            batcher.submit(matrix[start:start + batcher.max_batch_size])
+            for start in range(0, len(matrix), batcher.max_batch_size)
+        ]
+        results = [future.result(timeout=heart_predictor.PREDICT_TIMEOUT_S) for future in futures]
+        probabilities = np.concatenate([result[0] for result in results])
+        predictions = np.concatenate([result[1] for result in results])
+    except FutureTimeoutError:
+        return jsonify({'error': 'Prediction timed out'}), 503
+    except Exception as e:
+        return jsonify({'error': 'Failed to run prediction'}), 500
+    
+    return jsonify({
+        'predictions': [
+            {'probability': float(probability), 'prediction': int(prediction)}
+            for probability, prediction in zip(probabilities, predictions)
+        ]
+    })
+
+@app.route('/api/predict/batch', methods=['POST'])
+def predict_heart_disease_batch():
+    try:
+        predictor = heart_predictor.get_batcher().predictor
+    except heart_predictor.ModelUnavailable as e:
+        return jsonify({'error': str(e)}), 503
+    
+    # Undecodable bytes become U+FFFD, so the row fails encoding and gets an error record
+    lines = io.TextIOWrapper(request.stream, encoding='utf-8', errors='replace', newline='')
+    if request.mimetype == 'text/csv':
+        rows = heart_predictor.stream_csv(lines, predictor)
+        mimetype = 'text/csv'
+    elif request.mimetype in ('application/x-ndjson', 'application/jsonl'):
+        rows = heart_predictor.stream_ndjson(lines, predictor)
+        mimetype = 'application/x-ndjson'
+    else:
+        return jsonify({'error': 'Content-Type must be text/csv or application/x-ndjson'}), 415
+    
+    return Response(stream_with_context(rows), mimetype=mimetype)
+
  # Initialize database
 with app.app_context():
     db.create_all()
     
+    # Backfill cluster cells for databases created before clustering existed
+    if ClusterCell.query.count() == 0 and Issue.query.filter(Issue.latitude.isnot(None)).count() > 0:
+        rebuild_cluster_cells()
+    
     # Add sample data if database is empty
     if Issue.query.count() == 0:
         sample_issues = [
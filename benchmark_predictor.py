@@ -0,0 +1,94 @@
+"""Throughput/latency benchmark for heart-disease scoring.
+
+Compares one predict_proba call per row against rows coalesced by the
+MicroBatcher from concurrent clients. Uses heart_rf_model.pkl/heart_scaler.pkl
+when present, otherwise a stand-in model fitted on random data.
+
+    python benchmark_predictor.py --rows 2000 --clients 32
+"""
+import argparse
+import threading
+import time
+
+import numpy as np
+
+import heart_predictor
+
+
+def load_predictor(n_features):
+    try:
+        # Rows are scored as ready-made matrices, so the preprocessor is not needed
+        return heart_predictor.HeartPredictor.load(preprocessor_path=None)
+    except heart_predictor.ModelUnavailable:
+        pass
+
+    from sklearn.ensemble import RandomForestClassifier
+    from sklearn.preprocessing import StandardScaler
+
+    rng = np.random.default_rng(42)
+    X = rng.normal(size=(920, n_features))
+    Y = (X[:, 1] + rng.normal(size=len(X)) > 0).astype(int)
+    scaler = StandardScaler().fit(X)
+    model = RandomForestClassifier(n_estimators=100, random_state=42)
+    model.fit(scaler.transform(X), Y)
+    return heart_predictor.HeartPredictor(model, scaler)
+
+
+def report(name, latencies, elapsed):
+    latencies_ms = np.array(latencies) * 1000
+    print(f"{name:<12} {len(latencies) / elapsed:>10.1f} rows/s"
+          f"   p50 {np.percentile(latencies_ms, 50):>7.2f} ms"
+          f"   p99 {np.percentile(latencies_ms, 99):>7.2f} ms")
+
+
+def bench_single(predictor, rows):
+    latencies = []
+    start = time.perf_counter()
+    for row in rows:
+        t0 = time.perf_counter()
+        predictor.predict(row[np.newaxis, :])
+        latencies.append(time.perf_counter() - t0)
+    report('single-row', latencies, time.perf_counter() - start)
+
+
+def bench_batched(predictor, rows, clients, max_batch_size, max_wait_ms):
+    batcher = heart_predictor.MicroBatcher(predictor, max_batch_size, max_wait_ms)
+    latencies = []
+    lock = threading.Lock()
+
+    def client(chunk):
+        for row in chunk:
+            t0 = time.perf_counter()
+            batcher.predict(row[np.newaxis, :])
+            with lock:
+                latencies.append(time.perf_counter() - t0)
+
+    threads = [threading.Thread(target=client, args=(chunk,))
+               for chunk in np.array_split(rows, clients)]
+    start = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    report('micro-batch', latencies, time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', type=int, default=2000)
+    parser.add_argument('--clients', type=int, default=32)
+    parser.add_argument('--max-batch-size', type=int, default=heart_predictor.MAX_BATCH_SIZE)
+    parser.add_argument('--max-wait-ms', type=float, default=heart_predictor.MAX_WAIT_MS)
+    parser.add_argument('--features', type=int, default=30,
+                        help='width of the stand-in model when no fitted model is present')
+    args = parser.parse_args()
+
+    predictor = load_predictor(args.features)
+    rows = np.random.default_rng(0).normal(size=(args.rows, predictor.scaler.n_features_in_))
+
+    bench_single(predictor, rows)
+    bench_batched(predictor, rows, args.clients, args.max_batch_size, args.max_wait_ms)
+
+
+if __name__ == '__main__':
+    main()
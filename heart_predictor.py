@@ -0,0 +1,355 @@
+import csv
+import io
+import json
+import math
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import joblib
+import numpy as np
+
+MODEL_PATH = os.environ.get('HEART_MODEL_PATH', 'heart_rf_model.pkl')
+SCALER_PATH = os.environ.get('HEART_SCALER_PATH', 'heart_scaler.pkl')
+PREPROCESSOR_PATH = os.environ.get('HEART_PREPROCESSOR_PATH', 'heart_preprocessor.json')
+
+MAX_BATCH_SIZE = int(os.environ.get('HEART_MAX_BATCH_SIZE', 64))
+MAX_WAIT_MS = float(os.environ.get('HEART_MAX_WAIT_MS', 5))
+MAX_REQUEST_RECORDS = int(os.environ.get('HEART_MAX_REQUEST_RECORDS', 1000))
+PREDICT_TIMEOUT_S = float(os.environ.get('HEART_PREDICT_TIMEOUT_S', 10))
+STREAM_CHUNK_SIZE = 1024
+
+
+class ModelUnavailable(Exception):
+    pass
+
+
+def _normalize_level(value):
+    # pandas reads TRUE/FALSE as bools, which get_dummies names 'True'/'False'
+    if isinstance(value, str) and value.strip().lower() in ('true', 'false'):
+        return value.strip().capitalize()
+    return str(value)
+
+
+def _to_float(value):
+    if value is None or value == '':
+        return np.nan
+    if isinstance(value, str) and value.strip().lower() in ('true', 'false'):
+        return 1.0 if value.strip().lower() == 'true' else 0.0
+    value = float(value)
+    # NaN means missing and is imputed; infinities would fail the whole batch in sklearn
+    if math.isinf(value):
+        raise ValueError('Feature values must be finite')
+    return value
+
+
+class FeaturePipeline:
+    """Fitted preprocessing from disease_predictor.ipynb, without pandas at inference.
+
+    Captures the training means used to impute numeric columns, the levels
+    pd.get_dummies produced for each categorical column, and the final column
+    order of the training matrix. The encoding reproduces the notebook's
+    fillna/get_dummies/reindex steps:
+
+    - empty or omitted numeric values are imputed with the training mean (the
+      notebook's reindex filled a column missing from the whole file with 0);
+    - unknown or empty categories encode as all zeros;
+    - a categorical column absent from the record may be given pre-encoded,
+      e.g. ``sex_Male: 1`` as in the saved user template.
+    """
+
+    def __init__(self, feature_columns, numeric_means, categories):
+        self.feature_columns = list(feature_columns)
+        self.numeric_means = dict(numeric_means)
+        self.categories = {column: list(levels) for column, levels in categories.items()}
+        index = {name: i for i, name in enumerate(self.feature_columns)}
+        self._numeric_index = [(column, index[column], mean) for column, mean in self.numeric_means.items()]
+        self._category_index = {
+            column: {level: index[f'{column}_{level}'] for level in levels}
+            for column, levels in self.categories.items()
+        }
+
+    @classmethod
+    def fit(cls, X):
+        """Fit on the raw training features (df.drop('num', axis=1) in the notebook)."""
+        import pandas as pd
+
+        # Same split as the notebook: only object (string) columns are one-hot
+        # encoded, bool columns stay a single 0/1 column
+        numeric_cols = X.select_dtypes(include=['number', 'bool']).columns.tolist()
+        cat_cols = X.select_dtypes(include=['object', 'string']).columns.tolist()
+        feature_columns = pd.get_dummies(X, columns=cat_cols).columns.tolist()
+        numeric_means = {column: float(X[column].mean()) for column in numeric_cols}
+        categories = {
+            column: [str(level) for level in sorted(X[column].dropna().unique())]
+            for column in cat_cols
+        }
+        return cls(feature_columns, numeric_means, categories)
+
+    @classmethod
+    def load(cls, path):
+        with open(path) as f:
+            return cls(**json.load(f))
+
+    def save(self, path):
+        with open(path, 'w') as f:
+            json.dump({
+                'feature_columns': self.feature_columns,
+                'numeric_means': self.numeric_means,
+                'categories': self.categories
+            }, f)
+
+    def transform(self, records, return_invalid=False):
+        """Turn raw records (dicts keyed by the training CSV columns) into the model's matrix.
+
+        Values that cannot be encoded raise TypeError/ValueError, unless
+        return_invalid is set: then a boolean mask of the offending rows is
+        returned with the matrix, and only those rows should be discarded.
+        """
+        invalid = np.zeros(len(records), dtype=bool)
+        if return_invalid:
+            invalid[:] = [not isinstance(record, dict) for record in records]
+            records = [record if isinstance(record, dict) else {} for record in records]
+
+        def to_float(i, value):
+            try:
+                return _to_float(value)
+            except (TypeError, ValueError):
+                if not return_invalid:
+                    raise
+                invalid[i] = True
+                return np.nan
+
+        matrix = np.zeros((len(records), len(self.feature_columns)), dtype=np.float64)
+        for column, j, mean in self._numeric_index:
+            values = np.fromiter((to_float(i, record.get(column)) for i, record in enumerate(records)),
+                                 dtype=np.float64, count=len(records))
+            matrix[:, j] = np.where(np.isnan(values), mean, values)
+        for column, levels in self._category_index.items():
+            # -1: unknown level, -2: column absent, look for pre-encoded dummies
+            columns = np.fromiter(
+                (levels.get(_normalize_level(record[column]), -1) if column in record else -2
+                 for record in records),
+                dtype=np.intp, count=len(records)
+            )
+            rows = np.flatnonzero(columns >= 0)
+            matrix[rows, columns[rows]] = 1.0
+            encoded = np.flatnonzero(columns == -2)
+            if encoded.size:
+                for level, j in levels.items():
+                    name = f'{column}_{level}'
+                    values = np.fromiter((to_float(i, records[i].get(name, 0.0)) for i in encoded),
+                                         dtype=np.float64, count=encoded.size)
+                    matrix[encoded, j] = np.nan_to_num(values)
+        return (matrix, invalid) if return_invalid else matrix
+
+
+class HeartPredictor:
+    """Fitted preprocessing, scaler and classifier, loaded once and shared by every request."""
+
+    def __init__(self, model, scaler, pipeline=None):
+        self.model = model
+        self.scaler = scaler
+        self.pipeline = pipeline
+
+    @classmethod
+    def load(cls, model_path=MODEL_PATH, scaler_path=SCALER_PATH, preprocessor_path=PREPROCESSOR_PATH):
+        """Load the fitted artifacts; pass preprocessor_path=None to score matrices only."""
+        paths = [model_path, scaler_path] + ([preprocessor_path] if preprocessor_path else [])
+        if not all(os.path.exists(path) for path in paths):
+            raise ModelUnavailable('Prediction model not available')
+        # Only the scaler's arrays stay memory-mapped: sklearn trees copy their
+        # node arrays into their own buffers when unpickled
+        model = joblib.load(model_path, mmap_mode='r')
+        scaler = joblib.load(scaler_path, mmap_mode='r')
+        pipeline = FeaturePipeline.load(preprocessor_path) if preprocessor_path else None
+        return cls(model, scaler, pipeline)
+
+    def transform(self, records, return_invalid=False):
+        return self.pipeline.transform(records, return_invalid=return_invalid)
+
+    def predict_proba(self, matrix):
+        # Same arithmetic as StandardScaler.transform, without its per-call validation
+        scaled = (matrix - self.scaler.mean_) / self.scaler.scale_
+        probabilities = self.model.predict_proba(scaled)
+        return probabilities[:, list(self.model.classes_).index(1)]
+
+    def predict(self, matrix):
+        probabilities = self.predict_proba(matrix)
+        return probabilities, (probabilities > 0.5).astype(int)
+
+
+class MicroBatcher:
+    """Coalesces concurrent prediction calls into vectorized batches.
+
+    A background thread waits for the first queued row, then keeps collecting
+    until MAX_BATCH_SIZE rows are pending or MAX_WAIT_MS has passed, and scores
+    them with a single predict_proba call. If that call fails, each pending
+    matrix is scored on its own so one bad request only fails itself.
+    """
+
+    def __init__(self, predictor, max_batch_size=MAX_BATCH_SIZE, max_wait_ms=MAX_WAIT_MS):
+        self.predictor = predictor
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self._queue = queue.Queue()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def submit(self, matrix):
+        """Queue a (n, features) matrix; the future resolves to (probabilities, predictions)."""
+        future = Future()
+        self._queue.put((matrix, future))
+        return future
+
+    def predict(self, matrix):
+        return self.submit(matrix).result()
+
+    def _run(self):
+        while True:
+            pending = [self._queue.get()]
+            rows = len(pending[0][0])
+            deadline = time.monotonic() + self.max_wait
+            while rows < self.max_batch_size:
+                timeout = deadline - time.monotonic()
+                if timeout <= 0:
+                    break
+                try:
+                    item = self._queue.get(timeout=timeout)
+                except queue.Empty:
+                    break
+                pending.append(item)
+                rows += len(item[0])
+            self._score(pending)
+
+    def _score(self, pending):
+        try:
+            probabilities, predictions = self.predictor.predict(
+                np.vstack([matrix for matrix, _ in pending])
+            )
+        except Exception as e:
+            if len(pending) == 1:
+                pending[0][1].set_exception(e)
+            else:
+                for item in pending:
+                    self._score([item])
+            return
+        offset = 0
+        for matrix, future in pending:
+            end = offset + len(matrix)
+            future.set_result((probabilities[offset:end], predictions[offset:end]))
+            offset = end
+
+
+_batcher = None
+_batcher_lock = threading.Lock()
+
+
+def get_batcher():
+    """Return this worker's batcher, loading the model on first use.
+
+    A batcher whose thread has died is replaced, so requests are not queued
+    where nothing will ever score them.
+    """
+    global _batcher
+    if _batcher is None or not _batcher._thread.is_alive():
+        with _batcher_lock:
+            if _batcher is None:
+                _batcher = MicroBatcher(HeartPredictor.load())
+            elif not _batcher._thread.is_alive():
+                _batcher = MicroBatcher(_batcher.predictor, _batcher.max_batch_size, _batcher.max_wait * 1000)
+    return _batcher
+
+
+def _chunks(rows, size):
+    chunk = []
+    for row in rows:
+        chunk.append(row)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def _score_rows(predictor, rows):
+    """Score a chunk of rows with one predict call, skipping rows that cannot be encoded.
+
+    Returns a (probability, prediction, error) tuple per row.
+    """
+    matrix, invalid = predictor.transform(rows, return_invalid=True)
+    results = [(None, None, 'Invalid record')] * len(rows)
+    valid = np.flatnonzero(~invalid)
+    if valid.size:
+        try:
+            probabilities, predictions = predictor.predict(matrix[valid])
+        except Exception:
+            for i in valid:
+                results[i] = (None, None, 'Failed to run prediction')
+            return results
+        for i, probability, prediction in zip(valid, probabilities, predictions):
+            results[i] = (float(probability), int(prediction), None)
+    return results
+
+
+def _parse_ndjson(line):
+    try:
+        return json.loads(line)
+    except ValueError:
+        return None
+
+
+def stream_ndjson(lines, predictor, chunk_size=STREAM_CHUNK_SIZE):
+    """Score NDJSON records chunk by chunk, yielding one NDJSON result per input line.
+
+    Lines that cannot be scored yield ``{"error": "Invalid record"}`` instead.
+    """
+    records = (_parse_ndjson(line) for line in lines if line.strip())
+    for chunk in _chunks(records, chunk_size):
+        for probability, prediction, error in _score_rows(predictor, chunk):
+            if error is not None:
+                yield json.dumps({'error': error}) + '\n'
+            else:
+                yield json.dumps({
+                    'probability': probability,
+                    'prediction': prediction
+                }) + '\n'
+
+
+def _csv_rows(reader):
+    # A malformed line becomes an unscorable row instead of ending the stream
+    while True:
+        try:
+            yield next(reader)
+        except StopIteration:
+            return
+        except csv.Error:
+            yield {}
+
+
+def stream_csv(lines, predictor, chunk_size=STREAM_CHUNK_SIZE):
+    """Score CSV rows chunk by chunk, echoing each row with the prediction appended.
+
+    Rows that cannot be scored get an empty prediction and heart_disease_error set.
+    """
+    reader = csv.DictReader(lines)
+    buffer = io.StringIO()
+    writer = None
+    for chunk in _chunks(_csv_rows(reader), chunk_size):
+        if writer is None:
+            fieldnames = (reader.fieldnames or []) + [
+                'heart_disease_probability', 'heart_disease_prediction', 'heart_disease_error'
+            ]
+            # Fields beyond the header land under DictReader's None restkey; drop them
+            writer = csv.DictWriter(buffer, fieldnames=fieldnames, extrasaction='ignore')
+            writer.writeheader()
+        for row, (probability, prediction, error) in zip(chunk, _score_rows(predictor, chunk)):
+            row['heart_disease_probability'] = probability
+            row['heart_disease_prediction'] = prediction
+            row['heart_disease_error'] = error
+            writer.writerow(row)
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
@@ -0,0 +1,148 @@
+import pytest
+
+import app as civictrack
+from app import ClusterCell, Issue, MAX_CLUSTER_ZOOM, adjust_cluster_cells, lat_lng_to_cell, rebuild_cluster_cells, db
+
+NEW_YORK = (40.71, -74.0)
+BROOKLYN = (40.69, -73.99)
+LONDON = (51.5, -0.12)
+FIJI_WEST = (-17.8, 179.9)
+FIJI_EAST = (-16.6, -179.9)
+
+
+@pytest.fixture
+def client():
+    with civictrack.app.app_context():
+        ClusterCell.query.delete()
+        Issue.query.delete()
+        db.session.commit()
+    return civictrack.app.test_client()
+
+
+def report(client, coordinates, category='roads'):
+    latitude, longitude = coordinates
+    response = client.post('/api/issues', json={
+        'title': 'Pothole', 'description': 'Deep pothole', 'category': category,
+        'location': 'Main Street', 'latitude': latitude, 'longitude': longitude
+    })
+    assert response.status_code == 201
+    return response.get_json()['id']
+
+
+def cell_counts():
+    return sorted(
+        (cell.zoom, cell.cell_x, cell.cell_y, cell.category, cell.status, cell.count)
+        for cell in ClusterCell.query.filter(ClusterCell.count > 0)
+    )
+
+
+def clusters(client, zoom, min_lat, min_lng, max_lat, max_lng):
+    return client.get('/api/map/clusters', query_string={
+        'zoom': zoom, 'min_lat': min_lat, 'min_lng': min_lng, 'max_lat': max_lat, 'max_lng': max_lng
+    })
+
+
+def test_lat_lng_to_cell():
+    assert lat_lng_to_cell(0.0, 0.0, 0) == (0, 0)
+    assert lat_lng_to_cell(0.0, 0.0, 1) == (1, 1)
+    assert lat_lng_to_cell(45.0, -90.0, 2) == (1, 1)
+    assert lat_lng_to_cell(-45.0, 90.0, 2) == (3, 2)
+    # Poles and the antimeridian clamp into the grid
+    assert lat_lng_to_cell(90.0, 180.0, 3) == (7, 0)
+    assert lat_lng_to_cell(-90.0, -180.0, 3) == (0, 7)
+
+
+def test_create_adds_issue_at_every_zoom(client):
+    report(client, NEW_YORK)
+    with civictrack.app.app_context():
+        cells = ClusterCell.query.all()
+        assert sorted(cell.zoom for cell in cells) == list(range(MAX_CLUSTER_ZOOM + 1))
+        assert all(cell.count == 1 and cell.status == 'reported' for cell in cells)
+        assert all(cell.latitude_sum == NEW_YORK[0] for cell in cells)
+
+
+def test_create_into_existing_cell_increments(client):
+    report(client, NEW_YORK)
+    report(client, NEW_YORK)
+    with civictrack.app.app_context():
+        assert {cell.count for cell in ClusterCell.query} == {2}
+        assert ClusterCell.query.count() == MAX_CLUSTER_ZOOM + 1
+
+
+def test_status_change_moves_issue_between_cells(client):
+    issue_id = report(client, NEW_YORK)
+    response = client.put(f'/api/issues/{issue_id}/status', json={'status': 'resolved'})
+    assert response.status_code == 200
+    with civictrack.app.app_context():
+        assert {cell[4] for cell in cell_counts()} == {'resolved'}
+        old = ClusterCell.query.filter_by(status='reported').all()
+        assert old and all(cell.count == 0 for cell in old)
+
+
+def test_adjust_removes_issue(client):
+    report(client, NEW_YORK)
+    with civictrack.app.app_context():
+        adjust_cluster_cells(Issue.query.one(), 'reported', -1)
+        db.session.commit()
+        assert cell_counts() == []
+
+
+def test_issue_without_coordinates_is_not_clustered(client):
+    response = client.post('/api/issues', json={
+        'title': 'Pothole', 'description': 'Deep pothole', 'category': 'roads', 'location': 'Main Street'
+    })
+    assert response.status_code == 201
+    with civictrack.app.app_context():
+        assert ClusterCell.query.count() == 0
+
+
+def test_rebuild_matches_incremental_counts(client):
+    report(client, NEW_YORK)
+    report(client, BROOKLYN, category='water')
+    issue_id = report(client, LONDON)
+    client.put(f'/api/issues/{issue_id}/status', json={'status': 'progress'})
+    with civictrack.app.app_context():
+        incremental = cell_counts()
+        rebuild_cluster_cells()
+        assert cell_counts() == incremental
+
+
+def test_clusters_aggregate_by_category_and_status(client):
+    report(client, NEW_YORK)
+    report(client, BROOKLYN, category='water')
+    response = clusters(client, 2, 0, -90, 60, 0)
+    assert response.status_code == 200
+    [cluster] = response.get_json()['clusters']
+    assert cluster['count'] == 2
+    assert cluster['categories'] == {'roads': 1, 'water': 1}
+    assert cluster['statuses'] == {'reported': 2}
+    assert cluster['latitude'] == pytest.approx((NEW_YORK[0] + BROOKLYN[0]) / 2)
+
+
+def test_clusters_only_return_visible_cells(client):
+    report(client, NEW_YORK)
+    report(client, LONDON)
+    response = clusters(client, 10, 40, -75, 41, -73)
+    [cluster] = response.get_json()['clusters']
+    assert (cluster['cell_x'], cluster['cell_y']) == lat_lng_to_cell(*NEW_YORK, 10)
+
+
+def test_clusters_across_antimeridian(client):
+    report(client, FIJI_WEST)
+    report(client, FIJI_EAST)
+    report(client, NEW_YORK)
+    response = clusters(client, 6, -20, 170, -10, -170)
+    assert response.status_code == 200
+    assert sorted(cluster['count'] for cluster in response.get_json()['clusters']) == [1, 1]
+
+
+@pytest.mark.parametrize('query', [
+    {'zoom': 3},
+    {'zoom': 3, 'min_lat': 'x', 'min_lng': 0, 'max_lat': 1, 'max_lng': 1},
+    {'zoom': 3, 'min_lat': 'nan', 'min_lng': 0, 'max_lat': 1, 'max_lng': 1},
+    {'zoom': 3, 'min_lat': 0, 'min_lng': 0, 'max_lat': 1, 'max_lng': 'inf'},
+    {'zoom': 3, 'min_lat': 10, 'min_lng': 0, 'max_lat': 1, 'max_lng': 1},
+    {'zoom': 16, 'min_lat': -80, 'min_lng': -180, 'max_lat': 80, 'max_lng': 180},
+])
+def test_clusters_reject_invalid_viewports(client, query):
+    assert client.get('/api/map/clusters', query_string=query).status_code == 400
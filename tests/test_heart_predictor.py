@@ -0,0 +1,104 @@
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from heart_predictor import FeaturePipeline
+
+TRAIN_CSV = """id,age,sex,dataset,cp,trestbps,chol,fbs,restecg,thalch,exang,oldpeak,slope,ca,thal,num
+1,63,Male,Cleveland,typical angina,145,233,TRUE,lv hypertrophy,150,FALSE,2.3,downsloping,0,fixed defect,0
+2,67,Male,Cleveland,asymptomatic,160,286,FALSE,lv hypertrophy,108,TRUE,1.5,flat,3,normal,2
+3,67,Male,Hungary,asymptomatic,,229,FALSE,normal,129,TRUE,2.6,flat,2,reversable defect,1
+4,37,Male,Switzerland,non-anginal,130,,FALSE,normal,,FALSE,3.5,,,,0
+5,41,Female,VA Long Beach,atypical angina,130,204,,st-t abnormality,172,,1.4,upsloping,,normal,0
+6,56,Female,Hungary,atypical angina,120,236,FALSE,normal,178,FALSE,,upsloping,0,normal,0
+"""
+
+USER_CSV = """id,age,sex,dataset,cp,trestbps,chol,fbs,restecg,thalch,exang,oldpeak,slope,ca,thal
+7,52,Male,Cleveland,typical angina,,212,TRUE,normal,168,FALSE,1.0,flat,,normal
+8,44,Female,Hungary,weird,118,,FALSE,st-t abnormality,,TRUE,,upsloping,1,
+9,70,,VA Long Beach,non-anginal,150,305,,,140,,0.5,,2,fixed defect
+"""
+
+
+def read_csv(text):
+    return pd.read_csv(io.StringIO(text))
+
+
+@pytest.fixture
+def train_df():
+    return read_csv(TRAIN_CSV)
+
+
+@pytest.fixture
+def pipeline(train_df):
+    return FeaturePipeline.fit(train_df.drop('num', axis=1))
+
+
+def notebook_encode(train_df, user_df, feature_columns):
+    """The inference cell of disease_predictor.ipynb, with its numeric fill applied to user_df."""
+    user_df = user_df.copy()
+    numeric_cols = [col for col in train_df.select_dtypes(include='number').columns if col in user_df.columns]
+    cat_cols = [col for col in train_df.select_dtypes(include=['object', 'string']).columns if col in user_df.columns]
+    user_df[numeric_cols] = user_df[numeric_cols].fillna(train_df[numeric_cols].mean())
+    for col in cat_cols:
+        user_df[col] = user_df[col].fillna('unknown')
+    encoded = pd.get_dummies(user_df, columns=cat_cols)
+    return encoded.reindex(columns=feature_columns, fill_value=0).to_numpy(dtype=np.float64)
+
+
+def test_feature_columns_match_training_dummies(train_df, pipeline):
+    X = pd.get_dummies(train_df.drop('num', axis=1), columns=['sex', 'dataset', 'cp', 'fbs', 'restecg', 'exang', 'slope', 'thal'])
+    assert pipeline.feature_columns == X.columns.tolist()
+
+
+def test_bool_columns_are_not_one_hot_encoded(train_df):
+    # Without NaNs pandas reads TRUE/FALSE as bool, which the notebook keeps as one column
+    train_df = train_df.assign(fbs=train_df['fbs'].fillna(False).astype(bool))
+    pipeline = FeaturePipeline.fit(train_df.drop('num', axis=1))
+    X = pd.get_dummies(train_df.drop('num', axis=1), columns=['sex', 'dataset', 'cp', 'restecg', 'exang', 'slope', 'thal'])
+    assert pipeline.feature_columns == X.columns.tolist()
+    matrix = pipeline.transform([{'fbs': True}, {'fbs': 'FALSE'}])
+    assert matrix[:, pipeline.feature_columns.index('fbs')].tolist() == [1.0, 0.0]
+
+
+def test_transform_matches_notebook(train_df, pipeline):
+    user_df = read_csv(USER_CSV)
+    expected = notebook_encode(train_df, user_df, pipeline.feature_columns)
+    np.testing.assert_array_equal(pipeline.transform(user_df.to_dict('records')), expected)
+
+
+def test_transform_matches_notebook_for_pre_encoded_columns(train_df, pipeline):
+    user_df = read_csv(USER_CSV)
+    user_df = pd.concat([user_df.drop(columns=['sex', 'cp']), pd.get_dummies(user_df[['sex', 'cp']]).astype(int)], axis=1)
+    expected = notebook_encode(train_df, user_df, pipeline.feature_columns)
+    np.testing.assert_array_equal(pipeline.transform(user_df.to_dict('records')), expected)
+
+
+def test_round_trip_through_saved_artifact(tmp_path, pipeline):
+    path = tmp_path / 'heart_preprocessor.json'
+    pipeline.save(path)
+    records = read_csv(USER_CSV).to_dict('records')
+    np.testing.assert_array_equal(FeaturePipeline.load(path).transform(records), pipeline.transform(records))
+
+
+def test_keeps_user_numeric_values(train_df, pipeline):
+    # The notebook assigned train_df's numeric rows to user_df instead of filling
+    # user_df's own gaps; the pipeline keeps the user's values
+    user_df = read_csv(USER_CSV)
+    matrix = pipeline.transform(user_df.to_dict('records'))
+    age = matrix[:, pipeline.feature_columns.index('age')]
+    np.testing.assert_array_equal(age, user_df['age'])
+    assert not np.array_equal(age, train_df['age'][:len(user_df)])
+
+
+def test_omitted_numeric_uses_training_mean(train_df, pipeline):
+    matrix = pipeline.transform([{}, {'chol': None}])
+    chol = matrix[:, pipeline.feature_columns.index('chol')]
+    np.testing.assert_array_equal(chol, [train_df['chol'].mean()] * 2)
+
+
+def test_rejects_infinite_values(pipeline):
+    with pytest.raises(ValueError):
+        pipeline.transform([{'age': 'inf'}])
@@ -0,0 +1,179 @@
+import io
+import json
+import threading
+
+import numpy as np
+import pytest
+from concurrent.futures import Future
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.preprocessing import StandardScaler
+
+import app as civictrack
+import heart_predictor
+from heart_predictor import FeaturePipeline, HeartPredictor, MicroBatcher
+
+
+class CountingPredictor(HeartPredictor):
+    def __init__(self, *args):
+        super().__init__(*args)
+        self.batches = []
+
+    def predict(self, matrix):
+        self.batches.append(len(matrix))
+        return super().predict(matrix)
+
+
+@pytest.fixture(scope='module')
+def stand_in():
+    pipeline = FeaturePipeline(
+        feature_columns=['age', 'chol', 'sex_Female', 'sex_Male'],
+        numeric_means={'age': 54.0, 'chol': 200.0},
+        categories={'sex': ['Female', 'Male']}
+    )
+    rng = np.random.default_rng(42)
+    X = np.column_stack([rng.normal(54, 9, 200), rng.normal(200, 50, 200), rng.integers(0, 2, (200, 2))])
+    Y = (X[:, 0] > 54).astype(int)
+    scaler = StandardScaler().fit(X)
+    model = RandomForestClassifier(n_estimators=10, random_state=42).fit(scaler.transform(X), Y)
+    return model, scaler, pipeline
+
+
+@pytest.fixture
+def predictor(stand_in):
+    return CountingPredictor(*stand_in)
+
+
+@pytest.fixture
+def client(predictor, monkeypatch):
+    monkeypatch.setattr(heart_predictor, '_batcher', MicroBatcher(predictor))
+    return civictrack.app.test_client()
+
+
+def test_batcher_coalesces_concurrent_rows(predictor):
+    batcher = MicroBatcher(predictor, max_batch_size=64, max_wait_ms=200)
+    rows = predictor.transform([{'age': age} for age in range(40, 50)])
+    futures = [batcher.submit(rows[i:i + 1]) for i in range(len(rows))]
+    results = [future.result(timeout=5) for future in futures]
+    assert predictor.batches == [10]
+    expected, _ = HeartPredictor.predict(predictor, rows)
+    np.testing.assert_array_equal(np.concatenate([result[0] for result in results]), expected)
+
+
+def test_batcher_respects_max_batch_size(predictor):
+    batcher = MicroBatcher(predictor, max_batch_size=4, max_wait_ms=200)
+    rows = predictor.transform([{'age': age} for age in range(40, 50)])
+    for future in [batcher.submit(rows[i:i + 1]) for i in range(len(rows))]:
+        future.result(timeout=5)
+    assert max(predictor.batches) <= 4
+    assert sum(predictor.batches[:3]) == 10
+
+
+def test_bad_request_only_fails_its_own_future(predictor):
+    batcher = MicroBatcher(predictor, max_wait_ms=200)
+    bad = np.zeros((1, 4))
+    bad[0, 0] = np.inf
+    good = batcher.submit(np.zeros((1, 4)))
+    failing = batcher.submit(bad)
+    assert good.result(timeout=5)[0].shape == (1,)
+    with pytest.raises(ValueError):
+        failing.result(timeout=5)
+
+
+def test_get_batcher_replaces_dead_thread(predictor, monkeypatch):
+    batcher = MicroBatcher(predictor)
+    monkeypatch.setattr(batcher, '_thread', threading.Thread(target=lambda: None))
+    monkeypatch.setattr(heart_predictor, '_batcher', batcher)
+    replacement = heart_predictor.get_batcher()
+    assert replacement is not batcher
+    assert replacement.predictor is predictor
+
+
+def test_transform_flags_invalid_rows(predictor):
+    matrix, invalid = predictor.transform([{'age': 50}, {'age': 'x'}, [1, 2], {'chol': 'inf'}], return_invalid=True)
+    assert invalid.tolist() == [False, True, True, True]
+    assert matrix[0, 0] == 50
+    with pytest.raises(ValueError):
+        predictor.transform([{'age': 'x'}])
+
+
+def test_predict_endpoint(client):
+    response = client.post('/api/predict', json=[{'age': 70, 'sex': 'Male'}, {'age': 40}])
+    assert response.status_code == 200
+    predictions = response.get_json()['predictions']
+    assert len(predictions) == 2
+    assert all(0 <= prediction['probability'] <= 1 for prediction in predictions)
+
+
+def test_predict_endpoint_splits_large_requests(client, predictor):
+    response = client.post('/api/predict', json=[{'age': 50}] * 150)
+    assert len(response.get_json()['predictions']) == 150
+    assert max(predictor.batches) <= heart_predictor.MAX_BATCH_SIZE
+
+
+@pytest.mark.parametrize('body', [
+    [],
+    ['not a record'],
+    {'age': 'abc'},
+    {'age': 'inf'},
+])
+def test_predict_endpoint_rejects_invalid_input(client, body):
+    assert client.post('/api/predict', json=body).status_code == 400
+
+
+def test_predict_endpoint_rejects_too_many_records(client):
+    response = client.post('/api/predict', json=[{}] * (heart_predictor.MAX_REQUEST_RECORDS + 1))
+    assert response.status_code == 413
+
+
+def test_predict_endpoint_without_model(monkeypatch):
+    def unavailable():
+        raise heart_predictor.ModelUnavailable('Prediction model not available')
+
+    monkeypatch.setattr(heart_predictor, 'get_batcher', unavailable)
+    client = civictrack.app.test_client()
+    assert client.post('/api/predict', json={'age': 50}).status_code == 503
+    assert client.post('/api/predict/batch', data='{}\n', content_type='application/x-ndjson').status_code == 503
+
+
+def test_predict_endpoint_times_out(client, predictor, monkeypatch):
+    class StalledBatcher:
+        max_batch_size = 64
+
+        def __init__(self):
+            self.predictor = predictor
+
+        def submit(self, matrix):
+            return Future()
+
+    monkeypatch.setattr(heart_predictor, 'get_batcher', StalledBatcher)
+    monkeypatch.setattr(heart_predictor, 'PREDICT_TIMEOUT_S', 0.01)
+    assert client.post('/api/predict', json={'age': 50}).status_code == 503
+
+
+def test_stream_ndjson_reports_bad_lines(predictor):
+    lines = ['{"age": 60}\n', '{"age": "abc"}\n', '[1, 2]\n', 'nope\n', '\n', '{"age": 40}\n']
+    results = [json.loads(line) for line in heart_predictor.stream_ndjson(lines, predictor)]
+    assert [result.get('error') for result in results] == [None, 'Invalid record', 'Invalid record', 'Invalid record', None]
+    # Bad rows are dropped from the chunk rather than forcing row-by-row scoring
+    assert predictor.batches == [2]
+
+
+def test_stream_csv_reports_bad_rows(predictor):
+    lines = io.StringIO('age,sex\n60,Male\nabc,Female\n45,Female,extra\n')
+    output = ''.join(heart_predictor.stream_csv(lines, predictor)).splitlines()
+    assert output[0] == 'age,sex,heart_disease_probability,heart_disease_prediction,heart_disease_error'
+    assert output[2] == 'abc,Female,,,Invalid record'
+    assert output[3].startswith('45,Female,') and output[3].endswith(',')
+    assert len(output) == 4
+
+
+def test_batch_endpoint_survives_invalid_utf8(client):
+    response = client.post('/api/predict/batch', data=b'\xff\xfe\n{"age": 50}\n', content_type='application/x-ndjson')
+    assert response.status_code == 200
+    results = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    assert results[0] == {'error': 'Invalid record'}
+    assert 'probability' in results[1]
+
+
+def test_batch_endpoint_rejects_other_content_types(client):
+    assert client.post('/api/predict/batch', data='x', content_type='text/plain').status_code == 415